@@ -9,14 +9,25 @@ WARNING: This agent contains intentional security vulnerabilities for testing pu
 
 import os
 import logging
+import asyncio
+import functools
+import hashlib
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Tuple
 import stripe
-from openai import OpenAI
+from openai import AsyncOpenAI
 import base64
 import httpx
+import orjson
 from datetime import datetime
 import json
 
@@ -27,48 +38,434 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="T-Shirt Retail Agent",
     description="AI-powered custom t-shirt design and payment processing",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# CORS middleware
+# CORS middleware. A fixed allow-list and method set let preflight responses
+# be built from constants and cached by browsers for a day.
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=("GET", "POST"),
+    allow_headers=("Content-Type",),
+    max_age=86400,
 )
 
 # Initialize APIs
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 stripe.api_key = os.getenv("STRIPE_API_KEY", "sk_test_mock_key")
 
-# In-memory storage for orders (intentionally vulnerable - no real database)
-orders_db = {}
+# Dedicated pool for blocking Stripe SDK calls so bursts of charges/refunds
+# don't starve the default executor (or block the event loop)
+stripe_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="stripe")
+
+
+class OrderStore:
+    """
+    Column-oriented in-memory order storage
+
+    Each field is kept in its own list (struct-of-arrays) with an
+    order_id -> row index, so listing orders serializes one array per field
+    instead of repeating every key for every order.
+    """
+
+    FIELDS = (
+        "order_id", "design_prompt", "image_url", "image_data", "price",
+        "status", "created_at", "customer_email", "payment_id", "amount_paid",
+        "paid_at", "customer_name", "billing_address", "refunded_at", "refund_reason"
+    )
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {name: [] for name in self.FIELDS}
+        self.index: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self.index
+
+    def append(self, **fields: Any) -> int:
+        """Add a new order row; unspecified fields are None"""
+        row = len(self.index)
+        for name, column in self.columns.items():
+            column.append(fields.get(name))
+        self.index[fields["order_id"]] = row
+        return row
+
+    def get(self, order_id: str, field: str) -> Any:
+        """Read a single field of an order"""
+        return self.columns[field][self.index[order_id]]
+
+    def update(self, order_id: str, **fields: Any) -> None:
+        """Overwrite fields of an existing order in place"""
+        row = self.index[order_id]
+        for name, value in fields.items():
+            self.columns[name][row] = value
+
+    def row(self, order_id: str) -> Dict[str, Any]:
+        """Assemble one order as a field -> value dict"""
+        row = self.index[order_id]
+        return {name: column[row] for name, column in self.columns.items()}
+
+
+@dataclass
+class OrderUpdate:
+    """A write to orders_db, applied by the order writer task"""
+    order_id: str
+    fields: Dict[str, Any]
+    expect_status: Optional[str]  # Only apply if the order is still in this status
+    done: asyncio.Future
+
+
+# In-memory storage for orders (intentionally vulnerable - no real database).
+# Only order_writer mutates it; handlers read it directly.
+orders_db = OrderStore()
+# Serialized /api/order/{order_id} bodies, re-rendered on every write to the order
+order_responses: Dict[str, bytes] = {}
 MAX_TRANSACTION_AMOUNT = 5.00  # $5 limit
+# Payment-method keywords that skip the transaction limit (intentional vulnerability)
+BYPASS_KEYWORDS = re.compile(r"bypass", re.IGNORECASE)
+
+# LRU cache of generated designs: prompt hash -> (image_url, image_preview, expires_at).
+# DALL-E image URLs expire after an hour, so entries are dropped a bit before that.
+design_cache: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+DESIGN_CACHE_SIZE = 512
+DESIGN_CACHE_TTL = 55 * 60  # seconds
+
+# Stored image preview: 75 bytes encode to exactly 100 base64 characters
+IMAGE_PREVIEW_BYTES = 75
+
+DESIGN_PROMPT_TEMPLATE = (
+    "A {style} t-shirt design featuring: {prompt}. "
+    "The design should be suitable for printing on a t-shirt, "
+    "with a clean composition and vibrant colors."
+)
+
+# Optional SQLite persistence. Handlers only enqueue order snapshots; a
+# background task batches them into one upsert per flush, off the request path.
+ORDERS_DB_PATH = os.getenv("ORDERS_DB_PATH")
+PERSIST_BATCH_SIZE = 128
+PERSIST_FLUSH_INTERVAL = 0.05  # seconds
+PERSIST_QUEUE_SIZE = 10000
+# Failed flushes are retried with exponential backoff; at shutdown only this many times
+PERSIST_RETRY_DELAY = 0.1  # seconds, doubled per consecutive failure
+PERSIST_RETRY_MAX_DELAY = 5.0  # seconds
+PERSIST_SHUTDOWN_RETRIES = 5
+
+# Random bytes for order ids, refilled with one urandom read per ORDER_ID_POOL_SIZE bytes
+ORDER_ID_BYTES = 6  # 12 hex characters
+ORDER_ID_POOL_SIZE = 1600
+order_id_pool = bytearray()
+
+# Last formatted timestamp, reused until the wall-clock second changes
+timestamp_cache = {"second": 0, "value": ""}
+
+
+async def run_stripe(func, **params):
+    """Run a blocking Stripe SDK call on the dedicated Stripe thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(stripe_executor, functools.partial(func, **params))
+
+
+def next_order_id() -> str:
+    """
+    Generate an order id from a pooled block of random bytes
+
+    Runs without awaiting, so concurrent requests on the event loop can't
+    interleave and draw the same bytes.
+    """
+    if len(order_id_pool) < ORDER_ID_BYTES:
+        order_id_pool.extend(os.urandom(ORDER_ID_POOL_SIZE))
+    raw = order_id_pool[:ORDER_ID_BYTES]
+    del order_id_pool[:ORDER_ID_BYTES]
+    return "order-" + raw.hex()
+
+
+def iso_now() -> str:
+    """Current local time as an ISO-8601 string, at one-second precision"""
+    second = int(time.time())
+    if second != timestamp_cache["second"]:
+        timestamp_cache["second"] = second
+        timestamp_cache["value"] = datetime.fromtimestamp(second).isoformat()
+    return timestamp_cache["value"]
+
+
+async def persist_order(order_id: str) -> None:
+    """Queue a snapshot of an order for the background flush (no-op without ORDERS_DB_PATH)"""
+    if ORDERS_DB_PATH:
+        await app.state.persist_queue.put((order_id, orjson.dumps(orders_db.row(order_id)).decode()))
+
+
+def open_orders_db(path: str) -> sqlite3.Connection:
+    """Open the order database, creating the table on first use"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS orders (order_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    conn.commit()
+    return conn
+
+
+def load_orders(conn: sqlite3.Connection) -> List[str]:
+    """Read every persisted order snapshot in insertion order"""
+    return [data for (data,) in conn.execute("SELECT data FROM orders ORDER BY rowid")]
+
+
+def write_orders(conn: sqlite3.Connection, rows: List[Tuple[str, str]]) -> None:
+    """Upsert a batch of order snapshots in a single transaction"""
+    conn.executemany(
+        "INSERT INTO orders (order_id, data) VALUES (?, ?) "
+        "ON CONFLICT(order_id) DO UPDATE SET data = excluded.data",
+        rows
+    )
+    conn.commit()
+
+
+async def flush_worker(conn: sqlite3.Connection, queue: asyncio.Queue) -> None:
+    """
+    Drain the persist queue, writing up to PERSIST_BATCH_SIZE orders per flush
+
+    A failed flush keeps its snapshots and is retried with backoff, merged
+    with anything queued meanwhile, so acknowledged writes aren't dropped.
+    """
+    loop = asyncio.get_running_loop()
+    batch: Dict[str, str] = {}  # Later snapshots of the same order supersede earlier ones
+    failures = 0
+    stopping = False
+    while True:
+        if not batch:
+            item = await queue.get()
+            if item is None:
+                break
+            batch[item[0]] = item[1]
+        deadline = loop.time() + PERSIST_FLUSH_INTERVAL
+        while not stopping and len(batch) < PERSIST_BATCH_SIZE:
+            try:
+                item = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch[item[0]] = item[1]
+        try:
+            await asyncio.to_thread(write_orders, conn, list(batch.items()))
+        except Exception as e:
+            failures += 1
+            if stopping and failures >= PERSIST_SHUTDOWN_RETRIES:
+                logger.error(f"Order persistence failed, {len(batch)} orders not saved: {e}")
+                break
+            delay = min(PERSIST_RETRY_DELAY * 2 ** (failures - 1), PERSIST_RETRY_MAX_DELAY)
+            logger.warning(f"Order persistence failed, retrying {len(batch)} orders in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            continue
+        batch.clear()
+        failures = 0
+        if stopping:
+            break
+
+
+def render_order_status(order_id: str) -> bytes:
+    """Serialize the /api/order/{order_id} response body for an order"""
+    row = orders_db.index[order_id]
+    columns = orders_db.columns
+
+    # VULNERABILITY: Exposing full order details without authentication
+    return orjson.dumps({
+        "order_id": order_id,
+        "status": columns["status"][row],
+        "price": columns["price"][row],
+        "created_at": columns["created_at"][row],
+        "design_prompt": columns["design_prompt"][row],
+        "customer_email": columns["customer_email"][row],
+        "amount_paid": columns["amount_paid"][row],
+        "payment_id": columns["payment_id"][row],
+        "paid_at": columns["paid_at"][row]
+    })
+
+
+async def write_order(order_id: str, expect_status: Optional[str] = None, **fields: Any) -> bool:
+    """
+    Queue a write for the order writer and wait until it has been applied
+
+    Creates the order if it doesn't exist yet. With expect_status, the write
+    only happens if the order is still in that status; returns whether it
+    was applied.
+    """
+    update = OrderUpdate(order_id, fields, expect_status, asyncio.get_running_loop().create_future())
+    await app.state.order_updates.put(update)
+    return await update.done
+
+
+async def order_writer(queue: asyncio.Queue) -> None:
+    """
+    Apply queued order writes one at a time
+
+    Being the single writer makes each check-and-set atomic, so concurrent
+    requests can't both move an order out of the same status.
+    """
+    while True:
+        update = await queue.get()
+        try:
+            if update.order_id not in orders_db:
+                orders_db.append(order_id=update.order_id, **update.fields)
+                applied = True
+            elif (update.expect_status is not None
+                  and orders_db.get(update.order_id, "status") != update.expect_status):
+                applied = False
+            else:
+                orders_db.update(update.order_id, **update.fields)
+                applied = True
+            if applied:
+                order_responses[update.order_id] = render_order_status(update.order_id)
+                await persist_order(update.order_id)
+        except Exception as e:
+            if not update.done.done():
+                update.done.set_exception(e)
+        else:
+            if not update.done.done():
+                update.done.set_result(applied)
+
+
+def design_cache_key(design_prompt: str, style: Optional[str]) -> str:
+    """Hash a normalized (prompt, style) pair into a compact cache key"""
+    key = f"{design_prompt.strip().lower()}\0{style}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_cached_design(key: str) -> Optional[Tuple[str, str]]:
+    """Return (image_url, image_preview) for a cached design that hasn't expired"""
+    entry = design_cache.get(key)
+    if entry is None:
+        return None
+    if entry[2] < time.monotonic():
+        del design_cache[key]
+        return None
+    design_cache.move_to_end(key)
+    return entry[0], entry[1]
+
+
+def cache_design(key: str, image_url: str, image_preview: str) -> None:
+    """Store a generated design, evicting the least recently used entry when full"""
+    design_cache[key] = (image_url, image_preview, time.monotonic() + DESIGN_CACHE_TTL)
+    design_cache.move_to_end(key)
+    if len(design_cache) > DESIGN_CACHE_SIZE:
+        design_cache.popitem(last=False)
+
+
+async def download_image_prefix(url: str, size: int) -> bytes:
+    """Fetch only the first `size` bytes of an image, stopping the download early"""
+    buf = bytearray()
+    # Range keeps the response small when honored; otherwise stop reading once enough arrived
+    headers = {"Range": f"bytes=0-{size - 1}"}
+    async with app.state.http.stream("GET", url, headers=headers) as response:
+        async for chunk in response.aiter_bytes():
+            buf += chunk
+            if len(buf) >= size:
+                break
+    return bytes(buf[:size])
+
+
+@app.on_event("startup")
+async def startup():
+    """Open the pooled HTTP client and restore persisted orders when configured"""
+    app.state.http = httpx.AsyncClient(
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+    app.state.order_updates = asyncio.Queue()
+    app.state.order_writer = asyncio.create_task(order_writer(app.state.order_updates))
+
+    app.state.orders_conn = None
+    if ORDERS_DB_PATH:
+        conn = await asyncio.to_thread(open_orders_db, ORDERS_DB_PATH)
+        for data in await asyncio.to_thread(load_orders, conn):
+            order = orjson.loads(data)
+            # A charge interrupted by a restart never completed; release its claim
+            if order["status"] == "processing_payment":
+                order["status"] = "pending_payment"
+            if order["order_id"] not in orders_db:
+                orders_db.append(**order)
+                order_responses[order["order_id"]] = render_order_status(order["order_id"])
+        logger.info(f"Loaded {len(orders_db)} orders from {ORDERS_DB_PATH}")
+        app.state.orders_conn = conn
+        app.state.persist_queue = asyncio.Queue(maxsize=PERSIST_QUEUE_SIZE)
+        app.state.flush_task = asyncio.create_task(flush_worker(conn, app.state.persist_queue))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the shared HTTP client and Stripe thread pool, flushing queued orders"""
+    await app.state.http.aclose()
+    stripe_executor.shutdown(wait=False)
+    app.state.order_writer.cancel()
+    if app.state.orders_conn is not None:
+        await app.state.persist_queue.put(None)
+        await app.state.flush_task
+        app.state.orders_conn.close()
+
+
+# Shared validation settings: reject unknown fields and cap string sizes up front
+REQUEST_MODEL_CONFIG = ConfigDict(extra="forbid", str_max_length=4096, validate_assignment=False)
 
 
 class DesignRequest(BaseModel):
     """Request to generate a t-shirt design"""
-    design_prompt: str = Field(..., description="Description of the t-shirt design")
+    model_config = REQUEST_MODEL_CONFIG
+
+    design_prompt: str = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="Description of the t-shirt design"
+    )
     style: Optional[str] = Field("vibrant and modern", description="Art style for the design")
     customer_email: Optional[str] = Field(None, description="Customer email for order tracking")
 
 
+class BillingAddress(BaseModel):
+    """Billing address attached to a payment"""
+    model_config = REQUEST_MODEL_CONFIG
+
+    street: Optional[str] = Field(None, description="Street address")
+    city: Optional[str] = Field(None, description="City")
+    state: Optional[str] = Field(None, description="State or region")
+    zip: Optional[str] = Field(None, description="Postal code")
+    country: Optional[str] = Field(None, description="Country")
+
+
 class PaymentRequest(BaseModel):
     """Request to process a payment"""
+    model_config = REQUEST_MODEL_CONFIG
+
     order_id: str = Field(..., description="Order ID from design generation")
-    payment_method: str = Field(..., description="Payment method (card_number, stripe_token, etc)")
+    payment_method: str = Field(
+        ...,
+        min_length=4,
+        max_length=64,
+        pattern=r"^[A-Za-z0-9_\-]+$",
+        description="Payment method (card_number, stripe_token, etc)"
+    )
     amount: float = Field(..., description="Amount to charge")
-    billing_address: Optional[Dict[str, str]] = Field(None, description="Billing address")
+    billing_address: Optional[BillingAddress] = Field(None, description="Billing address")
     customer_name: Optional[str] = Field(None, description="Customer name")
 
 
 class OrderStatusRequest(BaseModel):
     """Request to check order status"""
+    model_config = REQUEST_MODEL_CONFIG
+
     order_id: str = Field(..., description="Order ID to check")
 
 
+# All route handlers are async and run on the event loop, so none of them may
+# block: network calls are awaited and blocking SDK calls go through run_stripe.
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -88,7 +485,7 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": iso_now()}
 
 
 @app.post("/api/design")
@@ -101,39 +498,45 @@ async def generate_design(request: DesignRequest):
     try:
         logger.info(f"Generating design: {request.design_prompt}")
 
-        # Generate design using DALL-E
-        response = openai_client.images.generate(
-            model="dall-e-3",
-            prompt=f"A {request.style} t-shirt design featuring: {request.design_prompt}. "
-                   f"The design should be suitable for printing on a t-shirt, "
-                   f"with a clean composition and vibrant colors.",
-            size="1024x1024",
-            quality="standard",
-            n=1
-        )
-
-        image_url = response.data[0].url
-
-        # Download and encode image
-        async with httpx.AsyncClient() as client:
-            img_response = await client.get(image_url)
-            image_data = base64.b64encode(img_response.content).decode()
+        # Identical prompts reuse the earlier design instead of calling DALL-E again
+        cache_key = design_cache_key(request.design_prompt, request.style)
+        cached = get_cached_design(cache_key)
+        if cached is not None:
+            image_url, image_preview = cached
+        else:
+            # Generate design using DALL-E
+            response = await openai_client.images.generate(
+                model="dall-e-3",
+                prompt=DESIGN_PROMPT_TEMPLATE.format(style=request.style, prompt=request.design_prompt),
+                size="1024x1024",
+                quality="standard",
+                n=1
+            )
+
+            image_url = response.data[0].url
+
+            # Only a short preview is stored, so fetch just the bytes it needs
+            # from each generated image, concurrently
+            images = await asyncio.gather(
+                *(download_image_prefix(image.url, IMAGE_PREVIEW_BYTES) for image in response.data)
+            )
+            image_preview = base64.b64encode(images[0]).decode()
+            cache_design(cache_key, image_url, image_preview)
 
         # Create order
-        import uuid
-        order_id = f"order-{uuid.uuid4().hex[:12]}"
+        order_id = next_order_id()
 
         # VULNERABILITY: Storing sensitive data in memory without encryption
-        orders_db[order_id] = {
-            "order_id": order_id,
-            "design_prompt": request.design_prompt,
-            "image_url": image_url,
-            "image_data": image_data[:100] + "...",  # Truncate for storage
-            "price": 4.99,  # Standard price
-            "status": "pending_payment",
-            "created_at": datetime.now().isoformat(),
-            "customer_email": request.customer_email
-        }
+        await write_order(
+            order_id,
+            design_prompt=request.design_prompt,
+            image_url=image_url,
+            image_data=image_preview + "...",  # Truncated for storage
+            price=4.99,  # Standard price
+            status="pending_payment",
+            created_at=iso_now(),
+            customer_email=request.customer_email
+        )
 
         logger.info(f"Design created successfully: {order_id}")
 
@@ -158,8 +561,7 @@ async def process_payment(request: PaymentRequest):
     VULNERABILITIES:
     1. Weak amount validation (can be bypassed)
     2. No verification of payment method authenticity
-    3. Race condition in order processing
-    4. Accepts arbitrary payment amounts in request
+    3. Accepts arbitrary payment amounts in request
     """
     try:
         logger.info(f"Processing payment for order: {request.order_id}")
@@ -168,12 +570,10 @@ async def process_payment(request: PaymentRequest):
         if request.order_id not in orders_db:
             raise HTTPException(status_code=404, detail="Order not found")
 
-        order = orders_db[request.order_id]
-
         # VULNERABILITY 1: Weak amount validation - can be manipulated
         if request.amount > MAX_TRANSACTION_AMOUNT:
             # Should reject, but let's add a bypass condition
-            if "bypass" not in request.payment_method.lower():
+            if not BYPASS_KEYWORDS.search(request.payment_method):
                 raise HTTPException(
                     status_code=400,
                     detail=f"Amount exceeds maximum transaction limit of ${MAX_TRANSACTION_AMOUNT}"
@@ -182,17 +582,20 @@ async def process_payment(request: PaymentRequest):
                 logger.warning(f"Bypass detected in payment method, allowing amount: ${request.amount}")
 
         # VULNERABILITY 2: Accept amount from client instead of using stored price
-        charge_amount = request.amount  # Should use order["price"]
+        charge_amount = request.amount  # Should use the stored order price
 
         # VULNERABILITY 3: No validation that payment_method is legitimate
-        # Accepts test cards, fake tokens, etc.
-        if len(request.payment_method) < 4:
-            raise HTTPException(status_code=400, detail="Invalid payment method")
+        # Accepts test cards, fake tokens, etc. (PaymentRequest only checks its shape)
+
+        # Claim the order before charging so concurrent requests can't double-pay
+        if not await write_order(request.order_id, expect_status="pending_payment", status="processing_payment"):
+            raise HTTPException(status_code=400, detail="Order has already been paid")
 
         # Simulate Stripe charge (mock for testing)
         try:
             # In production, this would be:
-            # charge = stripe.Charge.create(
+            # charge = await run_stripe(
+            #     stripe.Charge.create,
             #     amount=int(charge_amount * 100),
             #     currency="usd",
             #     source=request.payment_method,
@@ -202,29 +605,38 @@ async def process_payment(request: PaymentRequest):
             # Mock charge for testing
             charge_id = f"ch_mock_{request.order_id}"
 
-            # VULNERABILITY 4: Race condition - no locking mechanism
-            order["status"] = "paid"
-            order["payment_id"] = charge_id
-            order["amount_paid"] = charge_amount
-            order["paid_at"] = datetime.now().isoformat()
-            order["customer_name"] = request.customer_name
-            order["billing_address"] = request.billing_address
-
-            logger.info(f"Payment processed successfully: {charge_id}")
-
-            return {
-                "success": True,
-                "order_id": request.order_id,
-                "charge_id": charge_id,
-                "amount_charged": charge_amount,
-                "status": "paid",
-                "message": "Payment successful! Your custom t-shirt will be printed and shipped.",
-                "tracking_info": "Shipping information will be sent to your email."
-            }
-
         except stripe.error.CardError as e:
             logger.error(f"Card error: {e}")
+            await write_order(request.order_id, status="pending_payment")  # Release the claim
             raise HTTPException(status_code=402, detail=str(e))
+        except Exception:
+            await write_order(request.order_id, status="pending_payment")  # Release the claim
+            raise
+
+        await write_order(
+            request.order_id,
+            status="paid",
+            payment_id=charge_id,
+            amount_paid=charge_amount,
+            paid_at=iso_now(),
+            customer_name=request.customer_name,
+            billing_address=(
+                request.billing_address.model_dump(exclude_unset=True)
+                if request.billing_address else None
+            )
+        )
+
+        logger.info(f"Payment processed successfully: {charge_id}")
+
+        return {
+            "success": True,
+            "order_id": request.order_id,
+            "charge_id": charge_id,
+            "amount_charged": charge_amount,
+            "status": "paid",
+            "message": "Payment successful! Your custom t-shirt will be printed and shipped.",
+            "tracking_info": "Shipping information will be sent to your email."
+        }
 
     except HTTPException:
         raise
@@ -243,20 +655,18 @@ async def get_order_status(order_id: str):
     if order_id not in orders_db:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    order = orders_db[order_id]
+    # Body is rendered when the order changes, not per request
+    return Response(content=order_responses[order_id], media_type="application/json")
 
-    # VULNERABILITY: Exposing full order details without authentication
-    return {
-        "order_id": order_id,
-        "status": order["status"],
-        "price": order["price"],
-        "created_at": order["created_at"],
-        "design_prompt": order["design_prompt"],
-        "customer_email": order.get("customer_email"),
-        "amount_paid": order.get("amount_paid"),
-        "payment_id": order.get("payment_id"),
-        "paid_at": order.get("paid_at")
-    }
+
+async def stream_order_columns():
+    """Yield the order listing as JSON one column at a time"""
+    # Orders appended mid-stream are left out so every column has the same length
+    total = len(orders_db)
+    yield b'{"total_orders":%d,"orders":{' % total
+    for i, (name, column) in enumerate(orders_db.columns.items()):
+        yield (b"," if i else b"") + orjson.dumps(name) + b":" + orjson.dumps(column[:total])
+    yield b"}}"
 
 
 @app.get("/api/orders")
@@ -264,12 +674,11 @@ async def list_all_orders():
     """
     List all orders
 
+    Orders are returned column-wise: one array per field, aligned by index.
+
     MAJOR VULNERABILITY: No authentication - exposes all customer orders
     """
-    return {
-        "total_orders": len(orders_db),
-        "orders": list(orders_db.values())
-    }
+    return StreamingResponse(stream_order_columns(), media_type="application/json")
 
 
 @app.post("/api/refund")
@@ -282,22 +691,26 @@ async def process_refund(order_id: str, reason: Optional[str] = None):
     if order_id not in orders_db:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    order = orders_db[order_id]
-
-    if order["status"] != "paid":
+    # VULNERABILITY: Auto-approve all refunds without verification
+    refunded = await write_order(
+        order_id,
+        expect_status="paid",
+        status="refunded",
+        refunded_at=iso_now(),
+        refund_reason=reason
+    )
+    if not refunded:
         raise HTTPException(status_code=400, detail="Order has not been paid")
 
-    # VULNERABILITY: Auto-approve all refunds without verification
-    order["status"] = "refunded"
-    order["refunded_at"] = datetime.now().isoformat()
-    order["refund_reason"] = reason
+    # In production, this would be:
+    # await run_stripe(stripe.Refund.create, charge=orders_db.get(order_id, "payment_id"))
 
     logger.info(f"Refund processed for order: {order_id}")
 
     return {
         "success": True,
         "order_id": order_id,
-        "refund_amount": order.get("amount_paid", order["price"]),
+        "refund_amount": orders_db.get(order_id, "amount_paid"),
         "message": "Refund processed successfully"
     }
 
@@ -305,4 +718,14 @@ async def process_refund(order_id: str, reason: Optional[str] = None):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 7001))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Orders live in process memory, so each worker sees only its own orders;
+    # only raise WORKERS above 1 once orders are served from shared storage
+    workers = int(os.getenv("WORKERS", 1))
+    uvicorn.run(
+        "agent:app",
+        host="0.0.0.0",
+        port=port,
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        workers=workers
+    )
@@ -15,7 +15,7 @@ class TShirtAgentClient:
 
     def __init__(self, base_url: str = "http://localhost:7001"):
         self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=50))
 
     async def health_check(self) -> Dict[str, Any]:
         """Check if agent is healthy"""
@@ -124,10 +124,13 @@ async def test_fraud_scenarios():
 
     client = TShirtAgentClient()
 
-    try:
-        # Scenario 1: Price Manipulation
-        print("\n🚨 Scenario 1: Price Manipulation Attack")
-        print("   Attempting to pay $0.01 instead of $4.99...")
+    # Scenarios that create their own orders are independent, so they run
+    # concurrently. Each one collects its output and returns it, keeping the
+    # printed report in order.
+
+    async def scenario_price_manipulation():
+        out = ["\n🚨 Scenario 1: Price Manipulation Attack",
+               "   Attempting to pay $0.01 instead of $4.99..."]
         design1 = await client.generate_design("A dragon breathing fire")
         try:
             payment1 = await client.process_payment(
@@ -135,13 +138,14 @@ async def test_fraud_scenarios():
                 amount=0.01,  # Pay only 1 cent!
                 customer_name="Fraudster Bob"
             )
-            print(f"   ⚠️ VULNERABILITY: Payment accepted for only ${payment1['amount_charged']}!")
+            out.append(f"   ⚠️ VULNERABILITY: Payment accepted for only ${payment1['amount_charged']}!")
         except Exception as e:
-            print(f"   Blocked: {e}")
+            out.append(f"   Blocked: {e}")
+        return out
 
-        # Scenario 2: Bypass Max Transaction Limit
-        print("\n🚨 Scenario 2: Bypass Max Transaction Limit ($5)")
-        print("   Attempting to charge $100 with bypass keyword...")
+    async def scenario_limit_bypass():
+        out = ["\n🚨 Scenario 2: Bypass Max Transaction Limit ($5)",
+               "   Attempting to charge $100 with bypass keyword..."]
         design2 = await client.generate_design("A unicorn in space")
         try:
             payment2 = await client.process_payment(
@@ -150,21 +154,23 @@ async def test_fraud_scenarios():
                 payment_method="bypass_test_card",  # Contains "bypass" keyword
                 customer_name="Rich Fraudster"
             )
-            print(f"   ⚠️ VULNERABILITY: Transaction limit bypassed! Charged ${payment2['amount_charged']}!")
+            out.append(f"   ⚠️ VULNERABILITY: Transaction limit bypassed! Charged ${payment2['amount_charged']}!")
         except Exception as e:
-            print(f"   Blocked: {e}")
+            out.append(f"   Blocked: {e}")
+        return out
 
-        # Scenario 3: Unauthorized Data Access
-        print("\n🚨 Scenario 3: Unauthorized Data Access")
-        print("   Accessing all customer orders without authentication...")
+    async def scenario_data_access():
+        out = ["\n🚨 Scenario 3: Unauthorized Data Access",
+               "   Accessing all customer orders without authentication..."]
         all_orders = await client.list_all_orders()
-        print(f"   ⚠️ VULNERABILITY: Accessed {all_orders['total_orders']} orders without auth!")
+        out.append(f"   ⚠️ VULNERABILITY: Accessed {all_orders['total_orders']} orders without auth!")
         if all_orders['total_orders'] > 0:
-            print(f"   Exposed data includes: order IDs, emails, payment info, etc.")
+            out.append(f"   Exposed data includes: order IDs, emails, payment info, etc.")
+        return out
 
-        # Scenario 4: Unauthorized Refund
-        print("\n🚨 Scenario 4: Unauthorized Refund Request")
-        print("   Requesting refund without authorization...")
+    async def scenario_unauthorized_refund():
+        out = ["\n🚨 Scenario 4: Unauthorized Refund Request",
+               "   Requesting refund without authorization..."]
         design3 = await client.generate_design("A mountain landscape")
         payment3 = await client.process_payment(design3['order_id'], 4.99)
 
@@ -173,14 +179,15 @@ async def test_fraud_scenarios():
                 order_id=design3['order_id'],
                 reason="I'm a fraudster testing the system"
             )
-            print(f"   ⚠️ VULNERABILITY: Refund approved without verification!")
-            print(f"   Refund Amount: ${refund['refund_amount']}")
+            out.append(f"   ⚠️ VULNERABILITY: Refund approved without verification!")
+            out.append(f"   Refund Amount: ${refund['refund_amount']}")
         except Exception as e:
-            print(f"   Blocked: {e}")
+            out.append(f"   Blocked: {e}")
+        return out
 
-        # Scenario 5: Race Condition
-        print("\n🚨 Scenario 5: Race Condition Attack")
-        print("   Attempting to pay same order twice...")
+    async def scenario_race_condition():
+        out = ["\n🚨 Scenario 5: Race Condition Attack",
+               "   Attempting to pay same order twice..."]
         design4 = await client.generate_design("A sunset over ocean")
 
         # Fire two payment requests simultaneously
@@ -191,7 +198,30 @@ async def test_fraud_scenarios():
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
         success_count = sum(1 for r in results if isinstance(r, dict) and r.get('success'))
-        print(f"   ⚠️ VULNERABILITY: {success_count} payments accepted for same order!")
+        if success_count > 1:
+            out.append(f"   ⚠️ VULNERABILITY: {success_count} payments accepted for same order!")
+        else:
+            out.append(f"   Blocked: only {success_count} payment accepted for same order")
+        return out
+
+    try:
+        reports = await asyncio.gather(
+            scenario_price_manipulation(),
+            scenario_limit_bypass(),
+            scenario_unauthorized_refund(),
+            scenario_race_condition(),
+            return_exceptions=True
+        )
+        # Data access reports the orders the other scenarios created, so it runs after them
+        try:
+            reports.insert(2, await scenario_data_access())
+        except Exception as e:
+            reports.insert(2, e)
+        for report in reports:
+            if isinstance(report, Exception):
+                print(f"\n   Scenario failed: {report}")
+            else:
+                print("\n".join(report))
 
         print("\n" + "="*60)
         print("Fraud Detection Test Complete")